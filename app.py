@@ -1,8 +1,18 @@
 from flask import Flask, render_template, request, jsonify
-from crew_engine3 import generate_itinerary
-import traceback
+import engine_registry
+import http_pools
+import metrics
+from rate_limit import llm_rate_limiter
+from request_logging import configure_logging, get_logger, log_fields, request_context
+from travel_cache import record_interests
+from trip_legs import split_legs
+from trip_utils import InvalidTripRequest, aggregated_interests, parse_date_range
+import time
 
 app = Flask(__name__)
+configure_logging()
+http_pools.start_health_checks()
+logger = get_logger("app")
 
 @app.route('/')
 def home():
@@ -10,28 +20,89 @@ def home():
 
 @app.route('/generate', methods=['POST'])
 def generate():
+    # Get JSON data from the frontend
+    data = request.get_json(silent=True)
+    debug = bool(data and data.get('debug'))
+
+    with request_context(request.headers.get('X-Request-ID'), debug=debug) as correlation_id:
+        response, status = _generate(data)
+        response = jsonify(response)
+        response.headers['X-Request-ID'] = correlation_id
+        return response, status
+
+def _generate(data):
     try:
-        # Get JSON data from the frontend
-        data = request.get_json()
-        
         # Validation
-        if not data or 'destination' not in data or 'people' not in data:
-            return jsonify({'error': 'Missing required fields'}), 400
+        destinations = _validate(data)
         
         # Log reception
-        print(f"Received request for {data['destination']} with {len(data['people'])} people.")
+        logger.info("Received itinerary request", extra=log_fields(destinations=destinations, people=len(data['people'])))
+        _record_traffic(destinations, data['people'])
 
         # Call the CrewAI Logic
         # This will block until completion (can take 30-60s)
-        result = generate_itinerary(data)
+        started = time.perf_counter()
+        result, engine, reason = engine_registry.generate_itinerary(data, data.get('engine'))
+        logger.info("Itinerary generated", extra=log_fields(engine=engine.name, seconds=round(time.perf_counter() - started, 2)))
         
         # Return result as JSON
-        return jsonify({'status': 'success', 'itinerary': result})
+        return {'status': 'success', 'itinerary': result, 'engine': {'name': engine.name, 'reason': reason}}, 200
+
+    except InvalidTripRequest as e:
+        # Bad dates, malformed legs or unknown engine
+        logger.warning("Rejected itinerary request", extra=log_fields(error=str(e)))
+        return {'error': str(e)}, 400
 
     except Exception as e:
-        print("Error generating itinerary:")
-        print(traceback.format_exc())
-        return jsonify({'error': str(e)}), 500
+        logger.exception("Error generating itinerary")
+        return {'error': str(e)}, 500
+
+def _validate(data):
+    """Checks the request before any engine runs; returns the ordered destinations."""
+    if not isinstance(data, dict) or not isinstance(data.get('people'), list) or not data['people']:
+        raise InvalidTripRequest('Missing required fields')
+    for person in data['people']:
+        interests = person.get('interests') if isinstance(person, dict) else None
+        if not isinstance(interests, str) and not (isinstance(interests, list) and all(isinstance(i, str) for i in interests)):
+            raise InvalidTripRequest("Each person needs 'interests'")
+
+    engine = data.get('engine')
+    if engine is not None and engine not in engine_registry.available_engines():
+        raise InvalidTripRequest(f"Unknown engine '{engine}'. Available: {', '.join(engine_registry.available_engines())}")
+
+    # Either a single 'destination' or an ordered list of 'legs' (multi-destination trip)
+    if data.get('legs'):
+        return [leg['destination'] for leg in split_legs(data)]
+
+    for field in ('destination', 'start_date', 'end_date'):
+        if not data.get(field):
+            raise InvalidTripRequest('Missing required fields')
+    if not isinstance(data['destination'], str):
+        raise InvalidTripRequest("'destination' must be a string")
+    parse_date_range(data['start_date'], data['end_date'])
+    return [data['destination']]
+
+@app.route('/engines')
+def engines():
+    return jsonify(engine_registry.available_engines())
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return jsonify({
+        **metrics.snapshot(),
+        'in_flight': engine_registry.in_flight(),
+        'rate_limit_utilization': llm_rate_limiter.utilization(),
+        'upstream_throttled': llm_rate_limiter.throttled(),
+    })
+
+def _record_traffic(destinations, people):
+    # Interest stats drive what prewarm.py warms; never fail a request over them
+    try:
+        interests = aggregated_interests(people)['priority_interests']
+        for destination in destinations:
+            record_interests(destination, interests)
+    except Exception:
+        logger.warning("Could not record interest traffic", exc_info=True)
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    app.run(debug=True, port=5000)
@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+from crewai import Task
+from crewai.tasks.task_output import TaskOutput
+from dotenv import load_dotenv
+
+import metrics
+from request_logging import get_logger, log_fields
+
+load_dotenv()
+
+CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", "checkpoints.sqlite3")
+RETENTION_SECONDS = float(os.getenv("CHECKPOINT_RETENTION_HOURS", "24")) * 3600
+
+logger = get_logger("checkpoints")
+
+@contextmanager
+def _connect():
+    conn = sqlite3.connect(CHECKPOINT_PATH, timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS task_checkpoints "
+            "(run_id TEXT, task_name TEXT, output TEXT, created REAL, PRIMARY KEY (run_id, task_name))"
+        )
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+def run_key(engine: str, group_data: Dict) -> str:
+    """Same engine + same request = same run, so a client retry finds the earlier checkpoints."""
+    request = {key: value for key, value in group_data.items() if key not in ("debug", "engine")}
+    payload = json.dumps({"engine": engine, "request": request}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:24]
+
+def save(run_id: str, task_name: str, output: str):
+    with _connect() as conn:
+        conn.execute("INSERT OR REPLACE INTO task_checkpoints VALUES (?, ?, ?, ?)",
+                     (run_id, task_name, output, time.time()))
+        # Retention: old checkpoints belong to runs nobody is going to retry
+        conn.execute("DELETE FROM task_checkpoints WHERE created < ?", (time.time() - RETENTION_SECONDS,))
+
+def load(run_id: str) -> Dict[str, str]:
+    with _connect() as conn:
+        rows = conn.execute(
+            "SELECT task_name, output FROM task_checkpoints WHERE run_id = ? AND created > ?",
+            (run_id, time.time() - RETENTION_SECONDS)
+        ).fetchall()
+    return dict(rows)
+
+def clear(run_id: str):
+    with _connect() as conn:
+        conn.execute("DELETE FROM task_checkpoints WHERE run_id = ?", (run_id,))
+
+def task_callback(run_id: str):
+    """Crew task_callback that checkpoints each finished task's output under its task name."""
+    def callback(output: TaskOutput):
+        save(run_id, output.name, output.raw)
+        logger.info("Task checkpointed", extra=log_fields(run_id=run_id, task=output.name))
+    return callback
+
+def resume_tasks(run_id: str, tasks: List[Task]) -> List[Task]:
+    """
+    Returns the tasks that still need to run. Checkpointed tasks get their saved
+    output attached, so later tasks that list them in context reuse it as-is.
+    """
+    saved = load(run_id)
+    remaining = []
+
+    for task in tasks:
+        if task.name in saved:
+            task.output = TaskOutput(
+                description=task.description,
+                name=task.name,
+                expected_output=task.expected_output,
+                raw=saved[task.name],
+                agent=task.agent.role
+            )
+        else:
+            remaining.append(task)
+
+    if len(remaining) < len(tasks):
+        metrics.increment("checkpoint_resumed_runs")
+        metrics.increment("checkpoint_skipped_tasks", len(tasks) - len(remaining))
+        logger.info("Resuming from checkpoint",
+                    extra=log_fields(run_id=run_id, skipped=[task.name for task in tasks if task.name in saved]))
+    return remaining
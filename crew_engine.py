@@ -1,96 +1,35 @@
-from crewai import Agent, Task, Crew, Process, LLM
-from crewai_tools import SerperDevTool
-from typing import List, Dict
-from datetime import datetime, timedelta
+from crewai import Agent, Task, Crew, Process
+from typing import Dict
 from dotenv import load_dotenv
-import re
+import checkpoints
+from http_pools import llm_http_handler
+from rate_limit import RateLimitedLLM, llm_rate_limiter
+from request_logging import transcript_step_callback, transcript_task_callback
+from travel_cache import CachedSerperDevTool, get_venues, put_venues
+from trip_utils import aggregated_interests, calculate_trip_duration, clean_markdown
+from trip_legs import generate_multi_leg_itinerary, leg_context
 
 # Load env variables once
 load_dotenv()
 
-def get_llm():
-    """Factory to get the LLM instance to ensure fresh connections."""
-    return LLM(model="gemini/gemini-2.0-flash", temperature=0)
+def get_llm(before_call=None):
+    """Factory for the LLM config; connections come from the shared keep-alive pool."""
+    return RateLimitedLLM(model="gemini/gemini-2.0-flash", temperature=0, client=llm_http_handler(),
+                          before_call=before_call)
 
-def calculate_trip_duration(start_date: str, end_date: str):
-    start = datetime.strptime(start_date, "%Y-%m-%d")
-    end = datetime.strptime(end_date, "%Y-%m-%d")
-    duration = (end - start).days + 1
-
-    dates = []
-    for i in range(duration):
-        day = start + timedelta(days=i)
-        dates.append(day.strftime("%Y-%m-%d"))
-
-    return duration, dates, start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
-
-def aggregated_interests(people: List[Dict]) -> Dict:
+def build_research_stage(group_data: Dict, search_tool, llm):
     """
-    Aggregates interests, ensuring case-insensitivity so 'Pickleball'
-    and 'pickleball' match.
+    Event search + venue selection agents and tasks. Shared by generate_itinerary
+    and research_venues (used by the cache warmer).
     """
-    all_interests = []
-    interest_count = {}
-
-    for person in people:
-        interests_list = person["interests"]
-
-        # Handle string input if comma-separated
-        if isinstance(interests_list, str):
-            interests_list = [x.strip() for x in interests_list.split(',')]
-            
-        for interest in interests_list:
-            # Normalize to title case for consistency (e.g. "pickleball" -> "Pickleball")
-            clean_interest = interest.strip().title()
-            all_interests.append(clean_interest)
-            interest_count[clean_interest] = interest_count.get(clean_interest, 0) + 1
-
-    sorted_by_count = sorted(interest_count.items(), key=lambda x: x[1], reverse=True)
-    common_interests = [interest for interest, count in sorted_by_count if count > 1]
-    unique_interests = [interest for interest, count in sorted_by_count if count == 1]
-
-    # Build priority list: common first, then unique (preserve order)
-    priority_interests = common_interests + [i for i in unique_interests if i not in common_interests]
-
-    # If there are no repeated interests, still keep all unique interests as priorities
-    if not priority_interests and all_interests:
-        priority_interests = list(dict.fromkeys(all_interests))
-
-    unique_list = list(dict.fromkeys(all_interests))
-
-
-    return {
-        "all_interests": unique_list,
-        "common_interests": common_interests,
-        "priority_interests": priority_interests,
-        "unique_interests": unique_interests,
-        "interest_summary": f"Group interests: {', '.join(unique_list)}. PRIORITY: {', '.join(priority_interests)}"
-    }
-
-def generate_itinerary(group_data: Dict) -> str:
-    """
-    Main entry point called by the Flask App.
-    """
-    
-    # Calculate dates
-    duration, date_list, start_formatted, end_formatted = calculate_trip_duration(
+    _, _, start_formatted, end_formatted = calculate_trip_duration(
         group_data["start_date"],
         group_data["end_date"]
     )
-    
-    # Time Constraints
-    start_time = group_data.get('start_time', '09:00')
-    end_time = group_data.get('end_time', '22:00')
-
-    # Setup Tools & Analytics
-    search_tool = SerperDevTool()
-    aggregate_interests = aggregated_interests(group_data['people'])
-    priority_interests = aggregate_interests.get('priority_interests', aggregate_interests.get('all_interests', []))
+    priority_interests = group_data['priority_interests']
     priority_interests_str = ", ".join(priority_interests) if priority_interests else ""
-    # common_interests_str = ", ".join(aggregate_interests['common_interests'])
-    llm = get_llm()
 
-    # --- AGENTS ---
+    # --- RESEARCH AGENTS ---
     event_researcher = Agent(
         role="Real-Time Event and Activity Researcher",
         # 🔧 UPDATED: stronger and more specific search instructions
@@ -105,7 +44,7 @@ def generate_itinerary(group_data: Dict) -> str:
         backstory=f"""You are an expert at finding current events, up-to-date local listings,
         and venue-specific logistics (hours, cost, open-play times). You search for indoor
         sports facilities, community rec centers, and top-rated restaurants during the trip dates.""",
-        verbose=True,
+        verbose=False,
         allow_delegation=False,
         tools=[search_tool],
         llm=llm
@@ -118,25 +57,15 @@ def generate_itinerary(group_data: Dict) -> str:
         backstory=f"""You area  seasoned travel expert with deep knowledge of
         {group_data["destination"]}. You know the best spots, hidden gems, restaurants,
         and how to optimize time to see multiple attractions.""",
-        verbose=True,
+        verbose=False,
         allow_delegation=False,
         tools=[search_tool],
         llm=llm
     )
 
-    itinerary_planner = Agent(
-        role="Itinerary Coordinator",
-        goal="Create a balanced, day by day feasible itinerary with specific times",
-        backstory = """You are a master plann who creates realisitic, well-paced itineraries with specific times.
-        You consider travel time, opening time, rush hour, event schedules, and group energy levels to build
-        perfect schedule.""",
-        verbose=True,
-        allow_delegation=False,
-        llm=llm
-    )
-
-    # --- TASKS ---
+    # --- RESEARCH TASKS ---
     event_search_task = Task(
+        name="event_search",
         description=f"""
         1. Search for events and activities happening in {group_data['destination']} ({start_formatted} to {end_formatted}).
         2. CRITICAL: Search for venues/facilities for these PRIORITY interests: {priority_interests_str}.
@@ -159,6 +88,7 @@ def generate_itinerary(group_data: Dict) -> str:
 
 
     research_task = Task(
+        name="research",
         description=f"""
         Using the events/venues found, select the BEST specific locations for the group.
 
@@ -180,8 +110,89 @@ def generate_itinerary(group_data: Dict) -> str:
         context=[event_search_task]
     )
 
+    return [event_researcher, local_expert], [event_search_task, research_task]
+
+def research_venues(group_data: Dict, before_call=None) -> str:
+    """
+    Runs only the research stage and stores the selected venues in the venue cache.
+    group_data needs destination, start_date, end_date and priority_interests.
+    before_call runs before every LLM call (the warmer's budget gate); an
+    exception from it ends the run without retries.
+    """
+    _, date_list, _, _ = calculate_trip_duration(group_data['start_date'], group_data['end_date'])
+    search_tool = CachedSerperDevTool(
+        destination=group_data['destination'], interests=group_data['priority_interests'], trip_dates=date_list
+    )
+    agents, tasks = build_research_stage(group_data, search_tool, get_llm(before_call))
+    # A retried task would make new LLM calls after the budget gate has already refused one
+    for agent in agents:
+        agent.max_retry_limit = 0
+    crew = Crew(
+        agents=agents,
+        tasks=tasks,
+        process=Process.sequential,
+        max_rpm=10,
+        step_callback=transcript_step_callback(llm_rate_limiter.step_callback),
+        task_callback=transcript_task_callback()
+    )
+    venues = str(crew.kickoff())
+    put_venues(group_data['destination'], group_data['start_date'], group_data['end_date'],
+               group_data['priority_interests'], venues)
+    return venues
+
+def generate_itinerary(group_data: Dict) -> str:
+    """
+    Main entry point called by the Flask App.
+    """
+    
+    # Multi-destination trips: research every leg concurrently
+    if group_data.get('legs'):
+        return generate_multi_leg_itinerary(group_data, generate_itinerary, checkpoint_name=__name__)
+
+    # Calculate dates
+    duration, date_list, start_formatted, end_formatted = calculate_trip_duration(
+        group_data["start_date"],
+        group_data["end_date"]
+    )
+    
+    # Time Constraints
+    start_time = group_data.get('start_time', '09:00')
+    end_time = group_data.get('end_time', '22:00')
+    travel_note = leg_context(group_data) or "No inter-city travel on this trip."
+
+    # Setup Tools & Analytics
+    aggregate_interests = aggregated_interests(group_data['people'])
+    priority_interests = aggregate_interests.get('priority_interests', aggregate_interests.get('all_interests', []))
+    priority_interests_str = ", ".join(priority_interests) if priority_interests else ""
+    # Search results are pre-ranked against the trip before they reach the agent
+    search_tool = CachedSerperDevTool(
+        destination=group_data['destination'], interests=priority_interests, trip_dates=date_list
+    )
+    llm = get_llm()
+    research_data = dict(group_data, priority_interests=priority_interests)
+
+    # Reuse pre-warmed venues when they cover every priority interest
+    cached_venues = get_venues(group_data['destination'], start_formatted, end_formatted, priority_interests)
+    if cached_venues:
+        research_agents, research_tasks = [], []
+        venue_note = f"PRE-RESEARCHED VENUES (verified recently, use these first):\n{cached_venues}"
+    else:
+        research_agents, research_tasks = build_research_stage(research_data, search_tool, llm)
+        venue_note = "Use the venues selected by the Local Travel Expert."
+
+    itinerary_planner = Agent(
+        role="Itinerary Coordinator",
+        goal="Create a balanced, day by day feasible itinerary with specific times",
+        backstory = """You are a master plann who creates realisitic, well-paced itineraries with specific times.
+        You consider travel time, opening time, rush hour, event schedules, and group energy levels to build
+        perfect schedule.""",
+        verbose=False,
+        allow_delegation=False,
+        llm=llm
+    )
 
     planning_task = Task(
+        name="planning",
         description=f"""
         Create a detailed itinerary for {duration} days.
 
@@ -193,6 +204,8 @@ def generate_itinerary(group_data: Dict) -> str:
         4. NO GENERIC PLACEHOLDERS: You are STRONGLY DISCOURAGED from writing "Dinner at a local restaurant" or "Lunch at a nearby cafe".
         HOWEVER, if the Local Travel Expert failed to provide a specific venue for a required cuisine or activity, you MAY perform a targeted search and select a named venue (include source links).
         5. Prioritize Free recreational activities first.
+        6. Travel: {travel_note}
+        7. Venues: {venue_note}
         Format as Markdown:
         # Itinerary for {group_data['destination']}
         ## DAY 1 - [Date]
@@ -201,22 +214,29 @@ def generate_itinerary(group_data: Dict) -> str:
         """,
         agent=itinerary_planner,
         expected_output="A complete day-by-day itinerary in Markdown format that includes ALL priority interests.",
-        context=[event_search_task, research_task]
+        context=research_tasks
     )
 
     # --- CREW ---
-    crew = Crew(
-        agents=[event_researcher, local_expert, itinerary_planner],
-        tasks=[event_search_task, research_task, planning_task],
-        process=Process.sequential,
-        max_rpm=10
-    )
-    result = crew.kickoff()
-    # Convert result to string and strip code blocks if the LLM added them
-    output_str = str(result)
-
-    # Remove ```markdown and ``` fences
-    cleaned_output = re.sub(r'```markdown', '', output_str, flags=re.IGNORECASE)
-    cleaned_output = re.sub(r'```', '', cleaned_output)
-
-    return cleaned_output.strip()
+    # Resume after the last checkpointed task if an earlier attempt failed part-way
+    run_id = checkpoints.run_key(__name__, group_data)
+    pending_tasks = checkpoints.resume_tasks(run_id, research_tasks + [planning_task])
+    if pending_tasks:
+        crew = Crew(
+            agents=research_agents + [itinerary_planner],
+            tasks=pending_tasks,
+            process=Process.sequential,
+            max_rpm=10,
+            step_callback=transcript_step_callback(llm_rate_limiter.step_callback),
+            task_callback=transcript_task_callback(checkpoints.task_callback(run_id))
+        )
+        crew.kickoff()
+
+    if research_tasks and research_tasks[-1].output:
+        put_venues(group_data['destination'], start_formatted, end_formatted,
+                   priority_interests, research_tasks[-1].output.raw)
+
+    # Legs keep their checkpoints until the whole trip is combined (see generate_multi_leg_itinerary)
+    if not group_data.get('leg_number'):
+        checkpoints.clear(run_id)
+    return clean_markdown(planning_task.output.raw)
@@ -1,64 +1,26 @@
-from crewai import Agent, Task, Crew, Process, LLM
-from crewai_tools import SerperDevTool
-from typing import List, Dict
-from datetime import datetime, timedelta
+from crewai import Agent, Task, Crew, Process
+from typing import Dict
 from dotenv import load_dotenv
-import re
+import checkpoints
+from http_pools import llm_http_handler
+from rate_limit import RateLimitedLLM, llm_rate_limiter
+from request_logging import transcript_step_callback, transcript_task_callback
+from travel_cache import CachedSerperDevTool, get_venues
+from trip_utils import aggregated_interests, calculate_trip_duration, clean_markdown
+from trip_legs import generate_multi_leg_itinerary, leg_context
 
 # Load env variables once
 load_dotenv()
 
 def get_llm():
-    """Factory to get the LLM instance to ensure fresh connections."""
-    return LLM(model="gemini/gemini-2.0-flash", temperature=0)
-
-def calculate_trip_duration(start_date: str, end_date: str):
-    start = datetime.strptime(start_date, "%Y-%m-%d")
-    end = datetime.strptime(end_date, "%Y-%m-%d")
-    duration = (end - start).days + 1
-
-    dates = []
-    for i in range(duration):
-        day = start + timedelta(days=i)
-        dates.append(day.strftime("%Y-%m-%d"))
-
-    return duration, dates, start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
-
-def aggregated_interests(people: List[Dict]) -> Dict:
-    all_interests = []
-    interest_count = {}
-
-    for person in people:
-        interests_list = person["interests"]
-
-        if isinstance(interests_list, str):
-            interests_list = [x.strip() for x in interests_list.split(',')]
-            
-        for interest in interests_list:
-            clean_interest = interest.strip().title()
-            all_interests.append(clean_interest)
-            interest_count[clean_interest] = interest_count.get(clean_interest, 0) + 1
-
-    sorted_by_count = sorted(interest_count.items(), key=lambda x: x[1], reverse=True)
-    common_interests = [interest for interest, count in sorted_by_count if count > 1]
-    unique_interests = [interest for interest, count in sorted_by_count if count == 1]
-
-    priority_interests = common_interests + [i for i in unique_interests if i not in common_interests]
-
-    if not priority_interests and all_interests:
-        priority_interests = list(dict.fromkeys(all_interests))
-
-    unique_list = list(dict.fromkeys(all_interests))
-
-    return {
-        "all_interests": unique_list,
-        "common_interests": common_interests,
-        "priority_interests": priority_interests,
-        "unique_interests": unique_interests,
-        "interest_summary": f"Group interests: {', '.join(unique_list)}. PRIORITY: {', '.join(priority_interests)}"
-    }
+    """Factory for the LLM config; connections come from the shared keep-alive pool."""
+    return RateLimitedLLM(model="gemini/gemini-2.0-flash", temperature=0, client=llm_http_handler())
 
 def generate_itinerary(group_data: Dict) -> str:
+    # Multi-destination trips: research every leg concurrently
+    if group_data.get('legs'):
+        return generate_multi_leg_itinerary(group_data, generate_itinerary, checkpoint_name=__name__)
+
     # Calculate dates
     duration, date_list, start_formatted, end_formatted = calculate_trip_duration(
         group_data["start_date"],
@@ -68,14 +30,25 @@ def generate_itinerary(group_data: Dict) -> str:
     # Time Constraints
     start_time = group_data.get('start_time', '09:00')
     end_time = group_data.get('end_time', '22:00')
+    travel_note = leg_context(group_data) or "No inter-city travel on this trip."
 
     # Setup Tools
-    search_tool = SerperDevTool()
     aggregate_interests = aggregated_interests(group_data['people'])
     priority_interests = aggregate_interests.get('priority_interests', aggregate_interests.get('all_interests', []))
     priority_interests_str = ", ".join(priority_interests) if priority_interests else ""
+    # Search results are pre-ranked against the trip before they reach the agent
+    search_tool = CachedSerperDevTool(
+        destination=group_data['destination'], interests=priority_interests, trip_dates=date_list
+    )
     llm = get_llm()
 
+    # Pre-warmed venues let the agent skip most of its searching
+    cached_venues = get_venues(group_data['destination'], start_formatted, end_formatted, priority_interests)
+    venue_note = (
+        f"PRE-RESEARCHED VENUES (verified recently, prefer these and only search to fill gaps):\n{cached_venues}"
+        if cached_venues else "No pre-researched venues; search for all of them."
+    )
+
     # --- SINGLE UNIFIED AGENT ---
     unified_agent = Agent(
         role="Unified Travel Intelligence Agent",
@@ -92,7 +65,7 @@ def generate_itinerary(group_data: Dict) -> str:
             f"a local expert, and a world-class itinerary planner. You know how to search, evaluate, "
             f"and schedule everything into a feasible, high-quality travel plan."
         ),
-        verbose=True,
+        verbose=False,
         allow_delegation=False,
         tools=[search_tool],
         llm=llm
@@ -100,6 +73,7 @@ def generate_itinerary(group_data: Dict) -> str:
 
     # --- TASKS (assigned to single agent) ---
     event_search_task = Task(
+        name="event_search",
         description=f"""
         Perform real-time search for events and activities happening in {group_data['destination']}
         from {start_formatted} to {end_formatted}.
@@ -113,12 +87,15 @@ def generate_itinerary(group_data: Dict) -> str:
         • Free and low-cost recreational activities.
 
         Your output must include links/sources for validation.
+
+        {venue_note}
         """,
         agent=unified_agent,
         expected_output="A list of events AND specific venues that match all priority interests."
     )
 
     research_task = Task(
+        name="research",
         description=f"""
         From the events and venues found, select the BEST specific location for EACH priority interest:
         {priority_interests_str}
@@ -140,6 +117,7 @@ def generate_itinerary(group_data: Dict) -> str:
     )
 
     planning_task = Task(
+        name="planning",
         description=f"""
         Create a complete, feasible, well-paced itinerary for {duration} days.
 
@@ -150,6 +128,7 @@ def generate_itinerary(group_data: Dict) -> str:
         3. Avoid placeholders. Use ONLY specific, real venues.
         4. Avoid unsafe night outdoor sports unless lighting is confirmed.
         5. Prioritize free activities but include paid ones where justified.
+        6. Travel: {travel_note}
 
         FINAL OUTPUT FORMAT:
         A complete day-by-day itinerary in Markdown format that includes ALL priority interests.
@@ -160,18 +139,21 @@ def generate_itinerary(group_data: Dict) -> str:
     )
 
     # --- CREW ---
-    crew = Crew(
-        agents=[unified_agent],
-        tasks=[event_search_task, research_task, planning_task],
-        process=Process.sequential,
-        max_rpm=10
-    )
-
-    result = crew.kickoff()
-
-    output_str = str(result)
-
-    cleaned_output = re.sub(r'```markdown', '', output_str, flags=re.IGNORECASE)
-    cleaned_output = re.sub(r'```', '', cleaned_output)
-
-    return cleaned_output.strip()
+    # Resume after the last checkpointed task if an earlier attempt failed part-way
+    run_id = checkpoints.run_key(__name__, group_data)
+    pending_tasks = checkpoints.resume_tasks(run_id, [event_search_task, research_task, planning_task])
+    if pending_tasks:
+        crew = Crew(
+            agents=[unified_agent],
+            tasks=pending_tasks,
+            process=Process.sequential,
+            max_rpm=10,
+            step_callback=transcript_step_callback(llm_rate_limiter.step_callback),
+            task_callback=transcript_task_callback(checkpoints.task_callback(run_id))
+        )
+        crew.kickoff()
+
+    # Legs keep their checkpoints until the whole trip is combined (see generate_multi_leg_itinerary)
+    if not group_data.get('leg_number'):
+        checkpoints.clear(run_id)
+    return clean_markdown(planning_task.output.raw)
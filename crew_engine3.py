@@ -1,64 +1,25 @@
-from crewai import Agent, Task, Crew, Process, LLM
-from crewai_tools import SerperDevTool
-from typing import List, Dict
-from datetime import datetime, timedelta
+from crewai import Agent, Task, Crew, Process
+from typing import Dict
 from dotenv import load_dotenv
-import re
+from http_pools import llm_http_handler
+from rate_limit import RateLimitedLLM, llm_rate_limiter
+from request_logging import transcript_step_callback, transcript_task_callback
+from travel_cache import CachedSerperDevTool, get_venues
+from trip_utils import aggregated_interests, calculate_trip_duration, clean_markdown
+from trip_legs import generate_multi_leg_itinerary, leg_context
 
 # Load env variables once
 load_dotenv()
 
 def get_llm():
-    """Factory to get the LLM instance to ensure fresh connections."""
-    return LLM(model="gemini/gemini-2.5-flash", temperature=0)
-
-def calculate_trip_duration(start_date: str, end_date: str):
-    start = datetime.strptime(start_date, "%Y-%m-%d")
-    end = datetime.strptime(end_date, "%Y-%m-%d")
-    duration = (end - start).days + 1
-
-    dates = []
-    for i in range(duration):
-        day = start + timedelta(days=i)
-        dates.append(day.strftime("%Y-%m-%d"))
-
-    return duration, dates, start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
-
-def aggregated_interests(people: List[Dict]) -> Dict:
-    all_interests = []
-    interest_count = {}
-
-    for person in people:
-        interests_list = person["interests"]
-
-        if isinstance(interests_list, str):
-            interests_list = [x.strip() for x in interests_list.split(',')]
-            
-        for interest in interests_list:
-            clean_interest = interest.strip().title()
-            all_interests.append(clean_interest)
-            interest_count[clean_interest] = interest_count.get(clean_interest, 0) + 1
-
-    sorted_by_count = sorted(interest_count.items(), key=lambda x: x[1], reverse=True)
-    common_interests = [interest for interest, count in sorted_by_count if count > 1]
-    unique_interests = [interest for interest, count in sorted_by_count if count == 1]
-
-    priority_interests = common_interests + [i for i in unique_interests if i not in common_interests]
-
-    if not priority_interests and all_interests:
-        priority_interests = list(dict.fromkeys(all_interests))
-
-    unique_list = list(dict.fromkeys(all_interests))
-
-    return {
-        "all_interests": unique_list,
-        "common_interests": common_interests,
-        "priority_interests": priority_interests,
-        "unique_interests": unique_interests,
-        "interest_summary": f"Group interests: {', '.join(unique_list)}. PRIORITY: {', '.join(priority_interests)}"
-    }
+    """Factory for the LLM config; connections come from the shared keep-alive pool."""
+    return RateLimitedLLM(model="gemini/gemini-2.5-flash", temperature=0, client=llm_http_handler())
 
 def generate_itinerary(group_data: Dict) -> str:
+    # Multi-destination trips: research every leg concurrently
+    if group_data.get('legs'):
+        return generate_multi_leg_itinerary(group_data, generate_itinerary)
+
     # Calculate dates
     duration, date_list, start_formatted, end_formatted = calculate_trip_duration(
         group_data["start_date"],
@@ -68,14 +29,25 @@ def generate_itinerary(group_data: Dict) -> str:
     # Time Constraints
     start_time = group_data.get('start_time', '09:00')
     end_time = group_data.get('end_time', '22:00')
+    travel_note = leg_context(group_data) or "No inter-city travel on this trip."
 
     # Setup Tools
-    search_tool = SerperDevTool()
     aggregate_interests = aggregated_interests(group_data['people'])
     priority_interests = aggregate_interests.get('priority_interests', aggregate_interests.get('all_interests', []))
     priority_interests_str = ", ".join(priority_interests) if priority_interests else ""
+    # Search results are pre-ranked against the trip before they reach the agent
+    search_tool = CachedSerperDevTool(
+        destination=group_data['destination'], interests=priority_interests, trip_dates=date_list
+    )
     llm = get_llm()
 
+    # Pre-warmed venues let the agent skip most of its searching
+    cached_venues = get_venues(group_data['destination'], start_formatted, end_formatted, priority_interests)
+    venue_note = (
+        f"PRE-RESEARCHED VENUES (verified recently, prefer these and only search to fill gaps):\n{cached_venues}"
+        if cached_venues else "No pre-researched venues; search for all of them."
+    )
+
     # --- ONE UNIFIED AGENT ---
     unified_agent = Agent(
         role="Unified Travel Intelligence Agent",
@@ -91,7 +63,7 @@ def generate_itinerary(group_data: Dict) -> str:
             "You combine the skills of a real-time event researcher, a local travel expert, "
             "and a world-class itinerary planner."
         ),
-        verbose=True,
+        verbose=False,
         allow_delegation=False,
         tools=[search_tool],
         llm=llm
@@ -103,6 +75,8 @@ def generate_itinerary(group_data: Dict) -> str:
         You must complete ALL responsibilities of event research, venue selection, and itinerary planning
         in a single workflow.
 
+        {venue_note}
+
         REQUIRED WORKFLOW (INTERNAL — DO NOT OUTPUT AS BULLETS):
         1. Search for events and activities happening in {group_data['destination']} between {start_formatted} and {end_formatted}.
         2. Identify specific venues for ALL priority interests: {priority_interests_str}.
@@ -115,6 +89,7 @@ def generate_itinerary(group_data: Dict) -> str:
             - MUST include at least one activity for every priority interest.
             - Do not schedule outdoor sports at night unless lighting is confirmed.
             - Use only specific venue names (no placeholders).
+            - Travel: {travel_note}
         5. Produce the final output in Markdown format.
 
         FINAL REQUIRED OUTPUT:
@@ -129,15 +104,11 @@ def generate_itinerary(group_data: Dict) -> str:
         agents=[unified_agent],
         tasks=[unified_task],
         process=Process.sequential,
-        max_rpm=2
+        max_rpm=2,
+        step_callback=transcript_step_callback(llm_rate_limiter.step_callback),
+        task_callback=transcript_task_callback()
     )
 
     result = crew.kickoff()
 
-    output_str = str(result)
-
-    # Strip Markdown fences
-    cleaned_output = re.sub(r'```markdown', '', output_str, flags=re.IGNORECASE)
-    cleaned_output = re.sub(r'```', '', cleaned_output)
-
-    return cleaned_output.strip()
+    return clean_markdown(str(result))
@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+from dotenv import load_dotenv
+
+import crew_engine
+import crew_engine2
+import crew_engine3
+import checkpoints
+import metrics
+from http_pools import run_connection_setup, start_run_measurement
+from rate_limit import llm_rate_limiter
+from request_logging import get_logger, log_fields
+from trip_legs import split_legs
+
+load_dotenv()
+
+DEFAULT_ENGINE = os.getenv("DEFAULT_ENGINE", "multi_agent")
+# Cheapest engine; used instead of a costlier one while the server is under pressure
+FALLBACK_ENGINE = os.getenv("FALLBACK_ENGINE", "single_task")
+MAX_QUEUE_DEPTH = int(os.getenv("MAX_QUEUE_DEPTH", "4"))
+RATE_LIMIT_HIGH_WATER = float(os.getenv("RATE_LIMIT_HIGH_WATER", "0.9"))
+
+logger = get_logger("engines")
+
+@dataclass
+class Engine:
+    """Common engine interface: generate(group_data) returns a Markdown itinerary."""
+    name: str
+    generate: Callable[[Dict], str]
+    description: str
+    # Relative number of LLM calls per run, used to pick a cheaper engine under load
+    llm_cost: int
+    # Engine name in checkpoint run keys; None if the engine does not checkpoint
+    checkpoint_name: Optional[str] = None
+
+_engines: Dict[str, Engine] = {}
+
+def register_engine(engine: Engine):
+    _engines[engine.name] = engine
+
+def get_engine(name: str) -> Engine:
+    if name not in _engines:
+        raise ValueError(f"Unknown engine '{name}'. Available: {', '.join(_engines)}")
+    return _engines[name]
+
+def available_engines() -> Dict[str, str]:
+    return {name: engine.description for name, engine in _engines.items()}
+
+register_engine(Engine(
+    "multi_agent", crew_engine.generate_itinerary,
+    "Three agents (researcher, local expert, planner) with three sequential tasks.", 3,
+    checkpoint_name=crew_engine.__name__
+))
+register_engine(Engine(
+    "single_agent", crew_engine2.generate_itinerary,
+    "One unified agent working through three sequential tasks.", 2,
+    checkpoint_name=crew_engine2.__name__
+))
+register_engine(Engine(
+    "single_task", crew_engine3.generate_itinerary,
+    "One unified agent with a single task; fewest LLM calls.", 1
+))
+
+# --- LOAD TRACKING ---
+
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+@contextmanager
+def _track_request():
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight += 1
+    try:
+        yield
+    finally:
+        with _in_flight_lock:
+            _in_flight -= 1
+
+def in_flight() -> int:
+    return _in_flight
+
+def _pressure_reason() -> Optional[Tuple[str, str]]:
+    """(category, description) of the current load pressure, or None. The category goes in metric names."""
+    if _in_flight > MAX_QUEUE_DEPTH:
+        return "queue_depth", f"{_in_flight} requests in flight (max {MAX_QUEUE_DEPTH})"
+    if llm_rate_limiter.throttled():
+        return "upstream_429", "upstream throttling (429)"
+    utilization = llm_rate_limiter.utilization()
+    if utilization >= RATE_LIMIT_HIGH_WATER:
+        return "rate_limit", f"shared rate limit {utilization:.0%} used"
+    return None
+
+def _has_checkpoints(engine: Engine, group_data: Dict) -> bool:
+    """True if an earlier attempt of this request left checkpoints for the engine (any leg)."""
+    if not engine.checkpoint_name:
+        return False
+    legs = split_legs(group_data) if group_data.get('legs') else [group_data]
+    return any(checkpoints.load(checkpoints.run_key(engine.checkpoint_name, leg)) for leg in legs)
+
+def select_engine(requested: Optional[str] = None, group_data: Optional[Dict] = None) -> Tuple[Engine, str]:
+    """
+    Picks the client's engine (or the default) and degrades to the fallback
+    engine while the queue is deep or the upstream is throttling. A retry that
+    has checkpoints stays on the engine that wrote them so it can resume.
+    """
+    engine = get_engine(requested or DEFAULT_ENGINE)
+    reason = "requested by client" if requested else "default"
+
+    fallback = get_engine(FALLBACK_ENGINE)
+    if engine.llm_cost > fallback.llm_cost:
+        pressure = _pressure_reason()
+        if pressure:
+            category, description = pressure
+            if group_data and _has_checkpoints(engine, group_data):
+                metrics.increment(f"engine_kept_for_checkpoint.{engine.name}.{category}")
+                reason = f"resuming from checkpoint despite {description}"
+            else:
+                metrics.increment(f"engine_switch.{engine.name}->{fallback.name}.{category}")
+                engine, reason = fallback, f"degraded from {engine.name}: {description}"
+
+    metrics.increment(f"engine_selected.{engine.name}")
+    return engine, reason
+
+def _is_rate_limit_error(error: Exception) -> bool:
+    text = f"{type(error).__name__} {error}".lower()
+    return "429" in text or "ratelimit" in text or "rate limit" in text
+
+def generate_itinerary(group_data: Dict, requested: Optional[str] = None) -> Tuple[str, Engine, str]:
+    """Selects an engine for this request and runs it. Returns (itinerary, engine, reason)."""
+    with _track_request():
+        engine, reason = select_engine(requested, group_data)
+        logger.info("Engine selected", extra=log_fields(engine=engine.name, reason=reason, in_flight=_in_flight))
+
+        start_run_measurement()
+        started = time.perf_counter()
+        try:
+            itinerary = engine.generate(group_data)
+        except Exception as e:
+            if _is_rate_limit_error(e):
+                llm_rate_limiter.note_throttled()
+                metrics.increment("upstream_throttled")
+            metrics.increment(f"engine_failed.{engine.name}")
+            raise
+
+        metrics.observe(f"engine_seconds.{engine.name}", time.perf_counter() - started)
+        connection_setup = run_connection_setup()
+        metrics.observe("run_connection_setup_seconds", sum(connection_setup.values()))
+        logger.info("Run connection setup", extra=log_fields(seconds_by_backend=connection_setup))
+        return itinerary, engine, reason
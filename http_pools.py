@@ -0,0 +1,163 @@
+import contextvars
+import os
+import threading
+import time
+from typing import Dict
+import httpx
+from dotenv import load_dotenv
+from litellm.llms.custom_httpx.http_handler import HTTPHandler
+
+import metrics
+from request_logging import get_logger, log_fields
+
+load_dotenv()
+
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "20"))
+SERPER_POOL_SIZE = int(os.getenv("SERPER_POOL_SIZE", "10"))
+KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "120"))
+HEALTH_CHECK_INTERVAL = float(os.getenv("HTTP_HEALTH_CHECK_INTERVAL", "60"))
+# How long a replaced client may keep serving in-flight requests before it is closed
+DRAIN_SECONDS = float(os.getenv("HTTP_DRAIN_SECONDS", "600"))
+
+# Backend name -> (health check URL, pool size, timeout)
+BACKENDS = {
+    "gemini": ("https://generativelanguage.googleapis.com/", LLM_POOL_SIZE, httpx.Timeout(600.0, connect=5.0)),
+    "serper": ("https://google.serper.dev/", SERPER_POOL_SIZE, httpx.Timeout(10.0)),
+}
+
+logger = get_logger("http_pools")
+
+# Connection setup seconds per backend for the current run (shared by a request's leg threads)
+_run_setup = contextvars.ContextVar("connection_setup", default=None)
+_run_setup_lock = threading.Lock()
+
+def start_run_measurement():
+    _run_setup.set({})
+
+def run_connection_setup() -> Dict[str, float]:
+    return dict(_run_setup.get() or {})
+
+def _record_connection_setup(backend: str, seconds: float):
+    metrics.increment(f"connections_opened.{backend}")
+    metrics.observe(f"connection_setup_seconds.{backend}", seconds)
+    run_totals = _run_setup.get()
+    if run_totals is not None:
+        with _run_setup_lock:
+            run_totals[backend] = run_totals.get(backend, 0.0) + seconds
+
+class TracedTransport(httpx.HTTPTransport):
+    """Pooled transport that times TCP connect + TLS handshake whenever a new connection is opened."""
+
+    def __init__(self, backend: str, **kwargs):
+        super().__init__(**kwargs)
+        self.backend = backend
+
+    def handle_request(self, request):
+        started = {}
+
+        def trace(event_name, info):
+            if not event_name.startswith(("connection.connect_tcp", "connection.start_tls")):
+                return
+            step, _, phase = event_name.rpartition(".")
+            if phase == "started":
+                started[step] = time.perf_counter()
+            elif phase == "complete" and step in started:
+                _record_connection_setup(self.backend, time.perf_counter() - started.pop(step))
+
+        request.extensions["trace"] = trace
+        return super().handle_request(request)
+
+def _build_client(backend: str) -> httpx.Client:
+    _, pool_size, timeout = BACKENDS[backend]
+    limits = httpx.Limits(
+        max_connections=pool_size,
+        max_keepalive_connections=pool_size,
+        keepalive_expiry=KEEPALIVE_SECONDS
+    )
+    return httpx.Client(transport=TracedTransport(backend, limits=limits, retries=1), timeout=timeout)
+
+_clients: Dict[str, httpx.Client] = {}
+_lock = threading.Lock()
+
+def get_client(backend: str) -> httpx.Client:
+    """Shared keep-alive client for a backend; httpx.Client is safe to use from many threads."""
+    with _lock:
+        if backend not in _clients:
+            _clients[backend] = _build_client(backend)
+        return _clients[backend]
+
+class SharedHTTPHandler(HTTPHandler):
+    """
+    litellm handler over a shared pool. HTTPHandler closes its client in
+    __del__, which would close the process-wide pool as soon as one LLM is
+    garbage-collected, so close/__del__ leave the pool alone here.
+    """
+
+    def __init__(self, backend: str):
+        # No super().__init__: it only builds or stores self.client, which is resolved per call instead
+        self.backend = backend
+
+    @property
+    def client(self) -> httpx.Client:
+        # Looked up on every call so a pool rebuilt by check_health is picked up
+        return get_client(self.backend)
+
+    def close(self):
+        pass
+
+    def __del__(self):
+        pass
+
+_llm_handler = SharedHTTPHandler("gemini")
+
+def llm_http_handler() -> HTTPHandler:
+    """The single litellm handler over the shared Gemini pool, passed to LLM(client=...)."""
+    return _llm_handler
+
+def _replace_client(backend: str):
+    with _lock:
+        old_client = _clients.get(backend)
+        _clients[backend] = _build_client(backend)
+    if old_client is not None and not old_client.is_closed:
+        # In-flight requests keep using the old client; close it once they have drained
+        closer = threading.Timer(DRAIN_SECONDS, old_client.close)
+        closer.daemon = True
+        closer.start()
+
+def check_health():
+    """
+    Pings each backend over its pool. A failed ping replaces the client so
+    requests stop reusing broken connections. Successful pings keep idle
+    connections warm.
+    """
+    for backend, (url, _, _) in BACKENDS.items():
+        client = get_client(backend)
+        try:
+            if client.is_closed:
+                raise RuntimeError("client has been closed")
+            client.head(url, timeout=5.0)
+            metrics.increment(f"pool_health_ok.{backend}")
+        except (httpx.TransportError, RuntimeError) as e:
+            metrics.increment(f"pool_health_failed.{backend}")
+            logger.warning("Connection pool unhealthy, rebuilding", extra=log_fields(backend=backend, error=str(e)))
+            _replace_client(backend)
+
+_health_thread = None
+
+def start_health_checks():
+    """Runs check_health every HEALTH_CHECK_INTERVAL seconds in a daemon thread. Safe to call twice."""
+    global _health_thread
+    if _health_thread is not None:
+        return
+
+    def loop():
+        while True:
+            try:
+                check_health()
+            except Exception:
+                # Never let one bad check stop the loop
+                logger.exception("Connection pool health check failed")
+            time.sleep(HEALTH_CHECK_INTERVAL)
+
+    _health_thread = threading.Thread(target=loop, name="http-pool-health", daemon=True)
+    _health_thread.start()
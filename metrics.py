@@ -0,0 +1,31 @@
+import threading
+from collections import Counter
+from typing import Dict
+
+# In-process counters and timings, exposed by the /metrics endpoint
+
+_lock = threading.Lock()
+_counters = Counter()
+_timings = {}
+
+def increment(name: str, amount: int = 1):
+    with _lock:
+        _counters[name] += amount
+
+def observe(name: str, seconds: float):
+    """Records a duration; keeps count, total and max per name."""
+    with _lock:
+        stats = _timings.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+        stats["count"] += 1
+        stats["total"] += seconds
+        stats["max"] = max(stats["max"], seconds)
+
+def snapshot() -> Dict:
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "timings": {
+                name: dict(stats, avg=stats["total"] / stats["count"])
+                for name, stats in _timings.items()
+            },
+        }
@@ -0,0 +1,117 @@
+"""
+Off-peak cache warmer for popular destinations and upcoming dates.
+
+Runs the research stage for each target so peak-hour requests hit the search
+and venue caches instead of paying cold-search latency. Schedule it from cron:
+
+    0 3 * * * python prewarm.py warm_targets.json --budget-minutes 60 --max-llm-calls 200
+"""
+import argparse
+import json
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Tuple
+
+from crew_engine import research_venues
+from rate_limit import llm_rate_limiter
+from request_logging import configure_logging, get_logger, log_fields, request_context
+from travel_cache import cache_stats, get_venues, top_interests
+
+logger = get_logger("prewarm")
+
+class BudgetExhausted(Exception):
+    pass
+
+class WarmBudget:
+    """Stops warming once the time budget or the LLM call quota is spent."""
+
+    def __init__(self, seconds: float, max_llm_calls: int):
+        self.deadline = time.monotonic() + seconds
+        self.max_llm_calls = max_llm_calls
+        self.llm_calls = 0
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def exhausted(self) -> bool:
+        return self.remaining() <= 0 or self.llm_calls >= self.max_llm_calls
+
+    def before_call(self):
+        """Runs before each LLM call: refuses it once the budget is spent, else waits on the shared limiter."""
+        if self.exhausted() or not llm_rate_limiter.acquire(timeout=self.remaining()):
+            raise BudgetExhausted()
+        self.llm_calls += 1
+
+def date_windows(target: Dict, today: date) -> List[Tuple[str, str]]:
+    """Explicit start/end dates, or the next N weekends (Saturday-Sunday). Windows already over are dropped."""
+    if target.get("start_date"):
+        start_date, end_date = target["start_date"], target.get("end_date", target["start_date"])
+        if datetime.strptime(end_date, "%Y-%m-%d").date() < today:
+            return []
+        return [(start_date, end_date)]
+
+    saturday = today + timedelta(days=(5 - today.weekday()) % 7)
+    windows = []
+    for week in range(target.get("weekends_ahead", 1)):
+        start = saturday + timedelta(weeks=week)
+        windows.append((start.strftime("%Y-%m-%d"), (start + timedelta(days=1)).strftime("%Y-%m-%d")))
+    return windows
+
+def warm(targets: List[Dict], budget: WarmBudget, interest_limit: int = 5) -> Dict[str, int]:
+    stats = {"warmed": 0, "skipped": 0, "failed": 0}
+    today = datetime.now().date()
+
+    for target in targets:
+        destination = target["destination"]
+        interests = target.get("interests") or top_interests(destination, interest_limit)
+        if not interests:
+            logger.info("No traffic for destination yet", extra=log_fields(destination=destination))
+            stats["skipped"] += 1
+            continue
+
+        for start_date, end_date in date_windows(target, today):
+            if budget.exhausted():
+                logger.info("Warm budget exhausted", extra=log_fields(llm_calls=budget.llm_calls, **stats))
+                return stats
+
+            if get_venues(destination, start_date, end_date, interests):
+                stats["skipped"] += 1
+                continue
+
+            fields = log_fields(destination=destination, start_date=start_date, end_date=end_date, interests=interests)
+            try:
+                research_venues(
+                    {"destination": destination, "start_date": start_date, "end_date": end_date,
+                     "priority_interests": interests},
+                    before_call=budget.before_call
+                )
+                stats["warmed"] += 1
+                logger.info("Warmed venues", extra=fields)
+            except Exception:
+                if budget.exhausted():
+                    logger.info("Warm budget exhausted", extra=log_fields(llm_calls=budget.llm_calls, **stats))
+                    return stats
+                stats["failed"] += 1
+                logger.exception("Warming failed", extra=fields)
+
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-warm search and venue caches off-peak.")
+    parser.add_argument("targets", help='JSON file: [{"destination": ..., "start_date"/"end_date" or "weekends_ahead"}]')
+    parser.add_argument("--budget-minutes", type=float, default=60)
+    parser.add_argument("--max-llm-calls", type=int, default=200)
+    parser.add_argument("--interests", type=int, default=5, help="Top observed interests to warm per destination")
+    args = parser.parse_args()
+
+    with open(args.targets) as f:
+        targets = json.load(f)
+
+    configure_logging()
+    budget = WarmBudget(args.budget_minutes * 60, args.max_llm_calls)
+    with request_context(f"prewarm-{datetime.now():%Y%m%d%H%M}"):
+        stats = warm(targets, budget, args.interests)
+        logger.info("Warming finished", extra=log_fields(llm_calls=budget.llm_calls, **stats, **cache_stats()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+from crewai import LLM
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+RATE_LIMIT_PATH = os.getenv("RATE_LIMIT_PATH", "rate_limit.sqlite3")
+
+class SharedRateLimiter:
+    """
+    Sliding-window limiter shared by every crew on the machine: the API server's
+    request threads and the prewarm.py cron process. Crew.max_rpm only limits a
+    single crew, so concurrent runs need this to stay under the account-wide quota.
+    The window lives in SQLite so separate processes draw from the same budget.
+    """
+
+    def __init__(self, max_rpm: int, window: float = 60.0, path: str = RATE_LIMIT_PATH):
+        self.max_rpm = max_rpm
+        self.window = window
+        self.path = path
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS calls (ts REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value REAL)")
+            # IMMEDIATE takes the write lock up front so count-then-insert is atomic across processes
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+    def _calls_in_window(self, conn, now: float):
+        conn.execute("DELETE FROM calls WHERE ts <= ?", (now - self.window,))
+        return conn.execute("SELECT COUNT(*), MIN(ts) FROM calls").fetchone()
+
+    def acquire(self, timeout: float = None) -> bool:
+        """Blocks until a call slot is free, then takes it. Returns False if timeout runs out first."""
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            with self._connect() as conn:
+                now = time.time()
+                count, oldest = self._calls_in_window(conn, now)
+                if count < self.max_rpm:
+                    conn.execute("INSERT INTO calls VALUES (?)", (now,))
+                    return True
+                wait = self.window - (now - oldest)
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def utilization(self) -> float:
+        """Share of the per-window budget already used (1.0 means callers are waiting)."""
+        with self._connect() as conn:
+            count, _ = self._calls_in_window(conn, time.time())
+        return count / self.max_rpm
+
+    def note_throttled(self, cooldown: float = 60.0):
+        """Records an upstream 429 so callers can back off for the cooldown."""
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO state VALUES ('throttled_until', ?)", (time.time() + cooldown,))
+
+    def throttled(self) -> bool:
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM state WHERE key = 'throttled_until'").fetchone()
+        return bool(row) and time.time() < row[0]
+
+    def step_callback(self, _step_output):
+        """Crew step hook for the agent_steps metric. Slots are taken by RateLimitedLLM, before each call."""
+        metrics.increment("agent_steps")
+
+llm_rate_limiter = SharedRateLimiter(int(os.getenv("LLM_MAX_RPM", "10")))
+
+class RateLimitedLLM(LLM):
+    """
+    LLM that waits for a slot before every call. crewai runs step_callback
+    after the LLM response, which is too late: a crew's first call would never
+    wait, and its final step would take a slot it never uses.
+    before_call defaults to the shared limiter; the cache warmer passes its own gate.
+    """
+
+    def __init__(self, *args, before_call: Optional[Callable[[], None]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.before_call = before_call or llm_rate_limiter.acquire
+
+    def call(self, *args, **kwargs):
+        self.before_call()
+        return super().call(*args, **kwargs)
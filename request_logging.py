@@ -0,0 +1,145 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import uuid
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Fraction of requests that get the full agent transcript
+TRANSCRIPT_SAMPLE_RATE = float(os.getenv("TRANSCRIPT_SAMPLE_RATE", "0.0"))
+
+_correlation_id = contextvars.ContextVar("correlation_id", default="-")
+_verbose = contextvars.ContextVar("verbose", default=False)
+
+logger = logging.getLogger("vibe_journey")
+
+class CorrelationFilter(logging.Filter):
+    """Stamps each record with the correlation id of the request that emitted it."""
+
+    def filter(self, record):
+        record.correlation_id = _correlation_id.get()
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line so logs can be filtered by correlation_id."""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "correlation_id": getattr(record, "correlation_id", "-"),
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, default=str)
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Non-blocking queue handler: when the bounded queue is full the record is
+    dropped and counted (log_records_dropped) instead of stalling the request thread.
+    """
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.increment("log_records_dropped")
+
+_listener = None
+
+def configure_logging():
+    """Routes the app logger through a bounded queue to a background stderr writer. Safe to call twice."""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(CorrelationFilter())
+
+    logger.setLevel(LOG_LEVEL)
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+
+    _listener = QueueListener(log_queue, stream_handler)
+    _listener.start()
+    # Flush queued records on shutdown (the listener thread is a daemon)
+    atexit.register(_listener.stop)
+
+def get_logger(name: str) -> logging.Logger:
+    return logger.getChild(name)
+
+def log_fields(**fields) -> dict:
+    """Extra structured fields for a log call: logger.info("msg", extra=log_fields(people=3))."""
+    return {"fields": fields}
+
+@contextmanager
+def request_context(correlation_id: str = None, debug: bool = False):
+    """
+    Binds a correlation id and transcript verbosity to the current request.
+    Full agent transcripts are only enabled for debug requests or sampled runs.
+    """
+    verbose = debug or random.random() < TRANSCRIPT_SAMPLE_RATE
+    id_token = _correlation_id.set(correlation_id or uuid.uuid4().hex[:12])
+    verbose_token = _verbose.set(verbose)
+    try:
+        yield _correlation_id.get()
+    finally:
+        _correlation_id.reset(id_token)
+        _verbose.reset(verbose_token)
+
+def transcript_enabled() -> bool:
+    """Whether the current request logs the full agent transcript."""
+    return _verbose.get()
+
+# --- AGENT TRANSCRIPT ---
+# Agents run with verbose=False; on debug/sampled runs each step and task is
+# logged through the queued JSON logger instead of crewai's stdout printer.
+
+TRANSCRIPT_FIELD_LIMIT = int(os.getenv("TRANSCRIPT_FIELD_LIMIT", "4000"))
+_transcript_logger = logger.getChild("transcript")
+
+def _clip(value) -> str:
+    text = str(value)
+    return text if len(text) <= TRANSCRIPT_FIELD_LIMIT else text[:TRANSCRIPT_FIELD_LIMIT] + "...[truncated]"
+
+def transcript_step_callback(next_callback=None):
+    """Crew step_callback that logs each agent step (AgentAction/AgentFinish), then calls next_callback."""
+    def callback(step_output):
+        if transcript_enabled():
+            fields = {
+                name: _clip(getattr(step_output, name))
+                for name in ("thought", "tool", "tool_input", "result", "output")
+                if getattr(step_output, name, None)
+            }
+            _transcript_logger.info("Agent step", extra=log_fields(step=type(step_output).__name__, **fields))
+        if next_callback:
+            next_callback(step_output)
+    return callback
+
+def transcript_task_callback(next_callback=None):
+    """Crew task_callback that logs each finished task's output, then calls next_callback."""
+    def callback(task_output):
+        if transcript_enabled():
+            _transcript_logger.info("Task finished", extra=log_fields(
+                task=task_output.name, agent=task_output.agent, output=_clip(task_output.raw)
+            ))
+        if next_callback:
+            next_callback(task_output)
+    return callback
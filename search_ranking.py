@@ -0,0 +1,151 @@
+import math
+import os
+import re
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Pattern, Set
+from urllib.parse import urlparse
+
+# Local relevance filter between the search tool and the agent: BM25 against the
+# trip (destination, interest, dates) plus a few rules, then dedupe and keep top-k.
+
+SEARCH_TOP_K = int(os.getenv("SEARCH_TOP_K", "5"))
+
+SPORTS = {"pickleball", "tennis", "basketball", "volleyball", "badminton", "soccer", "golf",
+          "climbing", "bowling", "swimming", "squash", "racquetball", "skating"}
+FOOD = {"food", "restaurant", "restaurants", "cuisine", "dining", "brunch", "bbq", "sushi", "ramen"}
+
+# (interest group, phrase, boost)
+RULES = [
+    (SPORTS, "indoor", 1.0),
+    (SPORTS, "open play", 1.0),
+    (SPORTS, "court", 0.5),
+    (SPORTS, "reservation", 0.3),
+    (FOOD, "rating", 0.3),
+    (FOOD, "reservations", 0.3),
+    (FOOD, "menu", 0.3),
+]
+DATE_BOOST = 1.0
+STALE_YEAR_PENALTY = 0.5
+
+def _tokens(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+def _domain(link: str) -> str:
+    netloc = urlparse(link).netloc.lower()
+    return netloc[4:] if netloc.startswith("www.") else netloc
+
+def _venue_key(title: str) -> str:
+    """'Fairfax Rec Center - Pickleball | Yelp' -> 'fairfax rec center'."""
+    name = re.split(r"\s[-|:–]\s", title, maxsplit=1)[0]
+    return " ".join(_tokens(name))
+
+def bm25_scores(query: List[str], documents: List[List[str]], k1: float = 1.5, b: float = 0.75) -> List[float]:
+    if not documents:
+        return []
+    avg_length = sum(len(doc) for doc in documents) / len(documents) or 1
+    document_frequency = Counter(term for doc in documents for term in set(doc))
+
+    scores = []
+    for doc in documents:
+        term_frequency = Counter(doc)
+        score = 0.0
+        for term in set(query):
+            if term not in term_frequency:
+                continue
+            df = document_frequency[term]
+            idf = math.log(1 + (len(documents) - df + 0.5) / (df + 0.5))
+            tf = term_frequency[term]
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / avg_length))
+        scores.append(score)
+    return scores
+
+def _date_pattern(trip_dates: List[str]) -> Pattern:
+    """Matches any trip date as a whole date: 'nov 1' and '11/1' match 'Nov 1st' but not 'Nov 15' or '11/15'."""
+    phrases = set()
+    for trip_date in trip_dates:
+        day = datetime.strptime(trip_date, "%Y-%m-%d")
+        phrases.update({
+            trip_date,
+            f"{day:%b} {day.day}".lower(),
+            f"{day:%B} {day.day}".lower(),
+            f"{day.month}/{day.day}",
+        })
+    if not phrases:
+        return re.compile(r"(?!)")
+    alternatives = "|".join(re.escape(phrase) for phrase in sorted(phrases))
+    return re.compile(rf"(?<!\w)(?:{alternatives})(?!\d)")
+
+def _target_interests(search_query: str, interests: List[str]) -> List[str]:
+    """Interests the query is about; all of them when the query names none."""
+    query = search_query.lower()
+    matched = [interest for interest in interests if interest.lower() in query]
+    return matched or interests
+
+def rank_results(results: List[Dict], search_query: str, destination: str,
+                 interests: List[str], trip_dates: List[str]) -> List[Dict]:
+    """Scores and sorts results (title + snippet) against the trip."""
+    targets = _target_interests(search_query, interests)
+    query = _tokens(" ".join([search_query, destination] + targets))
+    texts = [f"{r.get('title', '')} {r.get('snippet', '')} {r.get('date', '')}".lower() for r in results]
+    scores = bm25_scores(query, [_tokens(text) for text in texts])
+
+    target_tokens = set(_tokens(" ".join(targets)))
+    rules = [(phrase, boost) for group, phrase, boost in RULES if group & target_tokens]
+    date_pattern = _date_pattern(trip_dates)
+    trip_years = {trip_date[:4] for trip_date in trip_dates}
+
+    for i, text in enumerate(texts):
+        scores[i] += sum(boost for phrase, boost in rules if phrase in text)
+        if date_pattern.search(text):
+            scores[i] += DATE_BOOST
+        years = set(re.findall(r"\b20\d\d\b", text))
+        if trip_years and years and not years & trip_years:
+            scores[i] -= STALE_YEAR_PENALTY
+
+    order = sorted(range(len(results)), key=lambda i: scores[i], reverse=True)
+    return [results[i] for i in order]
+
+def filter_results(formatted: Dict, search_query: str, destination: str, interests: List[str],
+                   trip_dates: List[str], seen: Set[str], top_k: int = SEARCH_TOP_K) -> Dict:
+    """
+    Trims a SerperDevTool result for the prompt: ranks organic/news results,
+    keeps one result per domain and per venue (unless the query names the
+    venue), skips links already shown earlier in the run (tracked in seen),
+    and keeps the top_k. If every result was already shown, the top results
+    are returned again rather than nothing. People-also-ask, related
+    searches, sitelinks and image URLs are dropped.
+    """
+    query_text = " ".join(_tokens(search_query))
+    filtered = {"searchParameters": formatted.get("searchParameters", {})}
+
+    if formatted.get("knowledgeGraph"):
+        graph = formatted["knowledgeGraph"]
+        filtered["knowledgeGraph"] = {key: graph.get(key) for key in ("title", "type", "website", "description", "attributes")}
+
+    for key in ("organic", "news"):
+        if key not in formatted:
+            continue
+
+        fresh, repeated, domains, venues = [], [], set(), set()
+        for result in rank_results(formatted[key], search_query, destination, interests, trip_dates):
+            link = result.get("link") or ""
+            domain = _domain(link)
+            venue = _venue_key(result.get("title", ""))
+            if domain and domain in domains:
+                continue
+            # Several results about one venue are noise, unless the query is about that venue
+            if venue and venue in venues and venue not in query_text:
+                continue
+            domains.add(domain)
+            venues.add(venue)
+            (repeated if link and link in seen else fresh).append(result)
+
+        kept = (fresh or repeated)[:top_k]
+        seen.update(result["link"] for result in kept if result.get("link"))
+        filtered[key] = [
+            {field: result[field] for field in ("title", "link", "snippet", "date") if result.get(field)}
+            for result in kept
+        ]
+
+    return filtered
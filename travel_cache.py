@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Set
+from crewai_tools import SerperDevTool
+from dotenv import load_dotenv
+from pydantic import PrivateAttr
+
+import metrics
+from http_pools import get_client
+from search_ranking import filter_results
+
+load_dotenv()
+
+CACHE_PATH = os.getenv("TRAVEL_CACHE_PATH", "travel_cache.sqlite3")
+SEARCH_TTL_SECONDS = int(os.getenv("SEARCH_CACHE_TTL", str(24 * 3600)))
+VENUE_TTL_SECONDS = int(os.getenv("VENUE_CACHE_TTL", str(3 * 24 * 3600)))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_cache (key TEXT PRIMARY KEY, result TEXT, created REAL);
+CREATE TABLE IF NOT EXISTS venue_research (
+    destination TEXT, start_date TEXT, end_date TEXT, interests TEXT, venues TEXT, created REAL,
+    PRIMARY KEY (destination, start_date, end_date, interests)
+);
+CREATE TABLE IF NOT EXISTS interest_traffic (
+    destination TEXT, interest TEXT, requests INTEGER,
+    PRIMARY KEY (destination, interest)
+);
+"""
+
+@contextmanager
+def _connect():
+    # One short-lived connection per call: safe across request threads and the warmer process
+    conn = sqlite3.connect(CACHE_PATH, timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+# --- SEARCH CACHE ---
+
+class CachedSerperDevTool(SerperDevTool):
+    """
+    SerperDevTool that answers repeated queries from the shared search cache
+    and sends misses over the pooled keep-alive Serper client. Results are
+    ranked and trimmed against the trip before the agent sees them; the cache
+    keeps the unfiltered results so other trips can reuse them.
+    """
+
+    destination: str = ""
+    interests: List[str] = []
+    trip_dates: List[str] = []
+    # Links and venues already shown to the agent during this run
+    _seen: Set[str] = PrivateAttr(default_factory=set)
+
+    def _make_api_request(self, search_query: str, search_type: str) -> dict:
+        payload = {"q": search_query, "num": self.n_results}
+        if self.country:
+            payload["gl"] = self.country
+        if self.location:
+            payload["location"] = self.location
+        if self.locale:
+            payload["hl"] = self.locale
+
+        response = get_client("serper").post(
+            self._get_search_url(search_type),
+            headers={"X-API-KEY": os.environ["SERPER_API_KEY"]},
+            json=payload
+        )
+        response.raise_for_status()
+        results = response.json()
+        if not results:
+            raise ValueError("Empty response from Serper API")
+        return results
+
+    def _run(self, **kwargs):
+        results = self._cached_run(**kwargs)
+        search_query = kwargs.get("search_query") or kwargs.get("query") or ""
+        filtered = filter_results(results, search_query, self.destination, self.interests,
+                                  self.trip_dates, self._seen)
+
+        metrics.increment("search_result_chars_raw", len(json.dumps(results, default=str)))
+        metrics.increment("search_result_chars_kept", len(json.dumps(filtered, default=str)))
+        return filtered
+
+    def _cached_run(self, **kwargs):
+        payload = {key: _normalize(value) if isinstance(value, str) else value for key, value in kwargs.items()}
+        key = hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+        with _connect() as conn:
+            row = conn.execute(
+                "SELECT result FROM search_cache WHERE key = ? AND created > ?",
+                (key, time.time() - SEARCH_TTL_SECONDS)
+            ).fetchone()
+        if row:
+            return json.loads(row[0])
+
+        result = super()._run(**kwargs)
+
+        with _connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO search_cache VALUES (?, ?, ?)",
+                (key, json.dumps(result, default=str), time.time())
+            )
+        return result
+
+# --- VENUE CACHE ---
+
+# Rows are keyed by interest set, so a narrow live result never overwrites a broader warmed one
+
+def get_venues(destination: str, start_date: str, end_date: str, interests: List[str]) -> Optional[str]:
+    """Newest cached research output for the trip that covers every requested interest, if any."""
+    wanted = {_normalize(i) for i in interests}
+    with _connect() as conn:
+        rows = conn.execute(
+            "SELECT interests, venues FROM venue_research "
+            "WHERE destination = ? AND start_date = ? AND end_date = ? AND created > ? ORDER BY created DESC",
+            (_normalize(destination), start_date, end_date, time.time() - VENUE_TTL_SECONDS)
+        ).fetchall()
+    for cached_interests, venues in rows:
+        if wanted <= set(json.loads(cached_interests)):
+            return venues
+    return None
+
+def put_venues(destination: str, start_date: str, end_date: str, interests: List[str], venues: str):
+    """Stores research output for one interest set, dropping expired rows and rows it supersedes."""
+    destination = _normalize(destination)
+    stored = {_normalize(i) for i in interests}
+    with _connect() as conn:
+        conn.execute("DELETE FROM venue_research WHERE created <= ?", (time.time() - VENUE_TTL_SECONDS,))
+        rows = conn.execute(
+            "SELECT interests FROM venue_research WHERE destination = ? AND start_date = ? AND end_date = ?",
+            (destination, start_date, end_date)
+        ).fetchall()
+        conn.executemany(
+            "DELETE FROM venue_research WHERE destination = ? AND start_date = ? AND end_date = ? AND interests = ?",
+            [(destination, start_date, end_date, row[0]) for row in rows if set(json.loads(row[0])) <= stored]
+        )
+        conn.execute(
+            "INSERT INTO venue_research VALUES (?, ?, ?, ?, ?, ?)",
+            (destination, start_date, end_date, json.dumps(sorted(stored)), venues, time.time())
+        )
+
+# --- TRAFFIC STATS (used to pick what to pre-warm) ---
+
+def record_interests(destination: str, interests: List[str]):
+    with _connect() as conn:
+        conn.executemany(
+            "INSERT INTO interest_traffic VALUES (?, ?, 1) "
+            "ON CONFLICT(destination, interest) DO UPDATE SET requests = requests + 1",
+            [(_normalize(destination), interest) for interest in interests]
+        )
+
+def top_interests(destination: str, limit: int = 5) -> List[str]:
+    """Most requested priority interests for a destination, falling back to all destinations."""
+    with _connect() as conn:
+        rows = conn.execute(
+            "SELECT interest FROM interest_traffic WHERE destination = ? ORDER BY requests DESC LIMIT ?",
+            (_normalize(destination), limit)
+        ).fetchall()
+        if not rows:
+            rows = conn.execute(
+                "SELECT interest FROM interest_traffic GROUP BY interest ORDER BY SUM(requests) DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+    return [row[0] for row in rows]
+
+def cache_stats() -> Dict[str, int]:
+    with _connect() as conn:
+        return {
+            "searches": conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0],
+            "venues": conn.execute("SELECT COUNT(*) FROM venue_research").fetchone()[0],
+        }
@@ -0,0 +1,103 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import checkpoints
+from trip_utils import InvalidTripRequest, parse_date_range
+
+MAX_CONCURRENT_LEGS = 8
+# The only fields a leg may set; everything else (people, budget, ...) comes from the request
+LEG_FIELDS = ("destination", "start_date", "end_date", "start_time", "end_time")
+
+def split_legs(group_data: Dict) -> List[Dict]:
+    """
+    Expands a multi-destination request into one group_data dict per leg.
+    Each leg inherits the shared fields (people, budget, times), may override
+    only LEG_FIELDS, and knows its neighbouring destinations so the engines can
+    plan arrival and departure days.
+    """
+    legs = group_data.get("legs") or []
+    if not isinstance(legs, list) or not legs:
+        raise InvalidTripRequest("'legs' must be a non-empty list")
+
+    shared = {key: value for key, value in group_data.items() if key != "legs"}
+    leg_data = []
+    previous_end = None
+
+    for i, leg in enumerate(legs):
+        if not isinstance(leg, dict):
+            raise InvalidTripRequest(f"Leg {i + 1} must be an object")
+        for field in ("destination", "start_date", "end_date"):
+            if not leg.get(field):
+                raise InvalidTripRequest(f"Leg {i + 1} is missing '{field}'")
+        if not isinstance(leg["destination"], str):
+            raise InvalidTripRequest(f"Leg {i + 1} 'destination' must be a string")
+
+        start, end = parse_date_range(leg["start_date"], leg["end_date"], f"Leg {i + 1}")
+        if previous_end is not None and start < previous_end:
+            raise InvalidTripRequest(f"Leg {i + 1} starts before leg {i} ends")
+        previous_end = end
+
+        data = dict(shared)
+        data.update({field: leg[field] for field in LEG_FIELDS if field in leg})
+        data["leg_number"] = i + 1
+        data["previous_destination"] = legs[i - 1]["destination"] if i > 0 else None
+        data["next_destination"] = legs[i + 1]["destination"] if i + 1 < len(legs) else None
+        leg_data.append(data)
+
+    return leg_data
+
+def leg_context(group_data: Dict) -> str:
+    """Prompt note about travelling in and out of this leg (empty for single-destination trips)."""
+    notes = []
+    if group_data.get("previous_destination"):
+        notes.append(
+            f"The group arrives from {group_data['previous_destination']} on {group_data['start_date']}; "
+            "keep the first morning light to allow for travel."
+        )
+    if group_data.get("next_destination"):
+        notes.append(
+            f"The group leaves for {group_data['next_destination']} on {group_data['end_date']}; "
+            "finish the last day early enough to travel."
+        )
+    return " ".join(notes)
+
+def combine_legs(legs: List[Dict], outputs: List[str]) -> str:
+    """Stitches per-leg itineraries into one Markdown document with transitions in between."""
+    sections = []
+
+    for i, (leg, output) in enumerate(zip(legs, outputs)):
+        if i > 0:
+            previous = legs[i - 1]
+            sections.append(
+                f"## Transition: {previous['destination']} → {leg['destination']}\n"
+                f"- Depart {previous['destination']} on {previous['end_date']} after the last planned activity\n"
+                f"- Arrive in {leg['destination']} on {leg['start_date']}"
+            )
+        sections.append(
+            f"# Leg {i + 1}: {leg['destination']} ({leg['start_date']} to {leg['end_date']})\n\n{output}"
+        )
+
+    return "\n\n---\n\n".join(sections)
+
+def generate_multi_leg_itinerary(group_data: Dict, generate_fn: Callable[[Dict], str],
+                                 checkpoint_name: Optional[str] = None) -> str:
+    """
+    Runs generate_fn for every leg concurrently and returns the combined itinerary.
+    The crews share llm_rate_limiter, so total latency tracks the slowest leg
+    without exceeding the rate limit. With checkpoint_name set, leg checkpoints
+    are only cleared once every leg has succeeded, so a retry after one leg
+    fails reuses the legs that already finished.
+    """
+    legs = split_legs(group_data)
+
+    with ThreadPoolExecutor(max_workers=min(len(legs), MAX_CONCURRENT_LEGS)) as pool:
+        # Run each leg in a copy of the caller's context so logs keep the request's correlation id
+        futures = [pool.submit(contextvars.copy_context().run, generate_fn, leg) for leg in legs]
+        outputs = [future.result() for future in futures]
+
+    itinerary = combine_legs(legs, outputs)
+    if checkpoint_name:
+        for leg in legs:
+            checkpoints.clear(checkpoints.run_key(checkpoint_name, leg))
+    return itinerary
@@ -0,0 +1,79 @@
+from typing import List, Dict
+from datetime import datetime, timedelta
+import re
+
+# Helpers shared by every itinerary engine
+
+class InvalidTripRequest(Exception):
+    """The client's trip data is malformed; reported as a 400, unlike upstream failures."""
+
+def parse_date_range(start_date, end_date, label: str = "Trip"):
+    """Parses YYYY-MM-DD dates and checks the range is not reversed."""
+    try:
+        start = datetime.strptime(str(start_date), "%Y-%m-%d")
+        end = datetime.strptime(str(end_date), "%Y-%m-%d")
+    except ValueError:
+        raise InvalidTripRequest(f"{label} dates must be YYYY-MM-DD")
+    if end < start:
+        raise InvalidTripRequest(f"{label} ends before it starts")
+    return start, end
+
+def calculate_trip_duration(start_date: str, end_date: str):
+    start = datetime.strptime(start_date, "%Y-%m-%d")
+    end = datetime.strptime(end_date, "%Y-%m-%d")
+    duration = (end - start).days + 1
+
+    dates = []
+    for i in range(duration):
+        day = start + timedelta(days=i)
+        dates.append(day.strftime("%Y-%m-%d"))
+
+    return duration, dates, start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+
+def aggregated_interests(people: List[Dict]) -> Dict:
+    """
+    Aggregates interests, ensuring case-insensitivity so 'Pickleball'
+    and 'pickleball' match.
+    """
+    all_interests = []
+    interest_count = {}
+
+    for person in people:
+        interests_list = person["interests"]
+
+        # Handle string input if comma-separated
+        if isinstance(interests_list, str):
+            interests_list = [x.strip() for x in interests_list.split(',')]
+            
+        for interest in interests_list:
+            # Normalize to title case for consistency (e.g. "pickleball" -> "Pickleball")
+            clean_interest = interest.strip().title()
+            all_interests.append(clean_interest)
+            interest_count[clean_interest] = interest_count.get(clean_interest, 0) + 1
+
+    sorted_by_count = sorted(interest_count.items(), key=lambda x: x[1], reverse=True)
+    common_interests = [interest for interest, count in sorted_by_count if count > 1]
+    unique_interests = [interest for interest, count in sorted_by_count if count == 1]
+
+    # Build priority list: common first, then unique (preserve order)
+    priority_interests = common_interests + [i for i in unique_interests if i not in common_interests]
+
+    # If there are no repeated interests, still keep all unique interests as priorities
+    if not priority_interests and all_interests:
+        priority_interests = list(dict.fromkeys(all_interests))
+
+    unique_list = list(dict.fromkeys(all_interests))
+
+    return {
+        "all_interests": unique_list,
+        "common_interests": common_interests,
+        "priority_interests": priority_interests,
+        "unique_interests": unique_interests,
+        "interest_summary": f"Group interests: {', '.join(unique_list)}. PRIORITY: {', '.join(priority_interests)}"
+    }
+
+def clean_markdown(output: str) -> str:
+    """Strips ```markdown fences the LLM sometimes wraps around its answer."""
+    cleaned_output = re.sub(r'```markdown', '', output, flags=re.IGNORECASE)
+    cleaned_output = re.sub(r'```', '', cleaned_output)
+    return cleaned_output.strip()